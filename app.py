@@ -1,5 +1,11 @@
+import asyncio as aio
 from dotenv import load_dotenv
 from flask import Flask, jsonify, request
+try:
+    import uvloop
+except ImportError:
+    # uvloop is unavailable on Windows, the default asyncio loop works fine there (just slower)
+    uvloop = None
 
 from gpt.client import OpenAISession
 from gpt.prompt import generate_alternative_prompt
@@ -7,14 +13,18 @@ from hubitat.client import HubitatClient
 from hubitat.command import DeviceCommandFunction
 from hubitat.query import DeviceQueryFunction, LayoutFunction
 from hubitat.subscribe import SubscribeFunction, UnsubscribeFunction
-from utilities.time import CurrentTimeFunction, ScheduledTimerFunction, TimerFunction
+from utilities.time import (CancelTimerFunction, CurrentTimeFunction, ScheduledTimerFunction, TimerFunction,
+                             TimerScheduler)
 
 load_dotenv()
+if uvloop is not None:
+    aio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
 app = Flask(__name__)
 
 he_client = HubitatClient()
 openai_session = OpenAISession()
+timer_scheduler = TimerScheduler(openai_session)
 
 he_client.load_devices()
 openai_session.load_prompt(generate_alternative_prompt(he_client.devices))
@@ -24,8 +34,9 @@ openai_session.load_functions(
      SubscribeFunction(he_client, openai_session),
      UnsubscribeFunction(he_client),
      LayoutFunction(he_client.devices),
-     TimerFunction(openai_session),
-     ScheduledTimerFunction(openai_session),
+     TimerFunction(timer_scheduler),
+     ScheduledTimerFunction(timer_scheduler),
+     CancelTimerFunction(timer_scheduler),
      CurrentTimeFunction()])
 
 
@@ -7,7 +7,7 @@ from typing import Any, Dict, List
 
 from gpt.functions import OpenAIFunction
 from hubitat.client import DeviceEvent
-from util import env_var
+from util import env_var, JSONObject
 
 
 class _MessageLog:
@@ -61,22 +61,23 @@ class OpenAISession:
         self._client = OpenAI(api_key=env_var('OPENAI_KEY'))
         self._gpt_model = env_var('GPT_MODEL')
         self._message_log = _MessageLog()
-        self._functions: List[OpenAIFunction] = []
         self._function_map: Dict[str, OpenAIFunction] = {}
+        self._tools: List[JSONObject] = []
 
     def load_prompt(self, prompt: str):
         self._message_log.unsafe_add_message({'role': 'system', 'content': prompt})
 
     def load_functions(self, functions: List[OpenAIFunction]):
-        self._functions = functions
         self._function_map = {f.get_name(): f for f in functions}
+        # The tool schemas never change, so only generate them once rather than on every completion
+        self._tools = [f.get_definition() for f in functions]
 
     async def handle_user_message(self, user_message: str) -> str:
         """Processes a message from the user, returns the response uttered by the LLM"""
         async with self._message_log.session() as session:
             session.append({'role': 'user', 'content': user_message})
 
-            completion = self._run_completion(session)
+            completion = await self._run_completion(session)
             return await self._handle_response(completion.choices[0], session)
 
     async def handle_device_event(self, device_event: DeviceEvent):
@@ -84,7 +85,7 @@ class OpenAISession:
         async with self._message_log.session() as session:
             session.append({'role': 'user', 'content': f'Device Event: {device_event.model_dump_json()}'})
 
-            completion = self._run_completion(session)
+            completion = await self._run_completion(session)
             print('GPT Device Event Response: ' + await self._handle_response(completion.choices[0], session))
 
     async def handle_timer_event(self, timer_name: str):
@@ -93,7 +94,7 @@ class OpenAISession:
             print(f'"{timer_name}" fired')
             session.append({'role': 'user', 'content': f'Timer Fired: {timer_name}'})
 
-            completion = self._run_completion(session)
+            completion = await self._run_completion(session)
             print(f'GPT {timer_name} Timer Response: ' + await self._handle_response(completion.choices[0], session))
 
     async def _handle_response(self, choice: Choice, session: _MessageLogSession) -> str:
@@ -116,7 +117,7 @@ class OpenAISession:
             tasks.append(aio.create_task(self._handle_tool_call(tool_call, session)))
         await aio.gather(*tasks)
 
-        completion = self._run_completion(session)
+        completion = await self._run_completion(session)
         return await self._handle_response(completion.choices[0], session)
 
     async def _handle_tool_call(self, tool_call: ChatCompletionMessageToolCall, session: _MessageLogSession):
@@ -125,7 +126,7 @@ class OpenAISession:
 
         session.append({'tool_call_id': tool_call.id, 'role': 'tool', 'content': result})
 
-    def _run_completion(self, session: _MessageLogSession) -> ChatCompletion:
-        return self._client.chat.completions.create(messages=session.get_messages(),
-                                                    tools=[f.get_definition() for f in self._functions],
-                                                    model=self._gpt_model)
+    async def _run_completion(self, session: _MessageLogSession) -> ChatCompletion:
+        # The OpenAI client is synchronous, run it on a worker thread so a GPT turn doesn't block the event loop
+        return await aio.to_thread(self._client.chat.completions.create, messages=session.get_messages(),
+                                   tools=self._tools, model=self._gpt_model)
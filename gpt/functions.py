@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
-from pydantic import BaseModel
+from functools import cache
+from pydantic.main import BaseModel
+import time
 from typing import Generic, Type, TypeVar, get_args, get_origin
 
 from util import JSONObject
@@ -12,12 +14,7 @@ class OpenAIFunction(Generic[M], ABC):
 
     def _get_model_type(self) -> Type[BaseModel]:
         """The secret sauce here - allows us to know the concrete model type of this function"""
-        for base in type(self).__orig_bases__:
-            origin = get_origin(base)
-            if origin is None or not issubclass(origin, OpenAIFunction):
-                continue
-            return get_args(base)[0]
-        raise Exception("Man, I dunno")
+        return _resolve_model_type(type(self))
 
     def get_definition(self) -> JSONObject:
         """
@@ -51,6 +48,19 @@ class OpenAIFunction(Generic[M], ABC):
     async def invoke(self, arguments: str) -> str:
         """Invokes this tool with the provided arguments"""
         print(f"'{self.get_name()}' request: {arguments}")
+        start = time.perf_counter_ns()
         result = await self.execute(self._get_model_type().model_validate_json(arguments))
-        print(f"'{self.get_name()}' response: {result}")
+        elapsed_ms = (time.perf_counter_ns() - start) / 1_000_000
+        print(f"'{self.get_name()}' response ({elapsed_ms:.1f}ms): {result}")
         return result
+
+
+@cache
+def _resolve_model_type(function_type: type) -> Type[BaseModel]:
+    """Walks the generic bases of a function class once, the model type can't change after class creation"""
+    for base in function_type.__orig_bases__:
+        origin = get_origin(base)
+        if origin is None or not issubclass(origin, OpenAIFunction):
+            continue
+        return get_args(base)[0]
+    raise Exception("Man, I dunno")
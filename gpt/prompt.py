@@ -50,7 +50,8 @@ You can receive messages for device state changes by subscribing to them with th
 You should unsubscribe if you don't need to know about a device's state changes anymore.
 
 Employ the set_timer and schedule_future_timer functions to delay actions until later.  The timer will send you a
-message when it goes off so that you can carry out the delayed action.
+message when it goes off so that you can carry out the delayed action.  Use the cancel_timer function if a delayed
+action is no longer needed.
 
 Device capability attributes and commands:"""
 
@@ -1,6 +1,8 @@
+import asyncio as aio
 import httpx
-from pydantic import BaseModel, Field
-from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from pydantic.fields import Field
+from pydantic.main import BaseModel
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 
 from util import env_var, JSONObject
 
@@ -60,7 +62,7 @@ capability_commands: Dict[str, List[DeviceCommand]] = {
 
 
 class HubitatDevice(BaseModel):
-    id: str
+    id: int
     label: str
     room: str
     capabilities: List[str]
@@ -76,12 +78,15 @@ class HubitatDevice(BaseModel):
 
 
 class DeviceEvent(BaseModel):
-    device_id: str = Field(alias='deviceId')
+    device_id: int = Field(alias='deviceId')
     attribute: str = Field(alias='name')
     value: Optional[int | str | float | bool]
 
 
 EventCallback = Callable[[DeviceEvent], Awaitable[None]]
+CommandSpec = Tuple[int, str, Optional[List[Any]]]
+
+_CONNECTION_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=8)
 
 
 class HubitatClient:
@@ -90,13 +95,16 @@ class HubitatClient:
     def __init__(self):
         self._address = f"http://{env_var('HE_ADDRESS')}/apps/api/{env_var('HE_APP_ID')}"
         self._token = env_var('HE_ACCESS_TOKEN')
+        self._params = {'access_token': self._token}
         self.devices: List[HubitatDevice] = []
 
-        self._subscriptions: Dict[int, Callable[[DeviceEvent], Awaitable[bool]]] = {}
+        # Events are routed with a single lookup on (device_id, attribute)
+        self._subscriptions: Dict[Tuple[int, str], EventCallback] = {}
+        self._subscribed_attributes: Dict[int, List[str]] = {}
 
     def load_devices(self):
         """Synchronous function which loads all the currently-known devices"""
-        resp = httpx.get(f"{self._address}/devices/all", params={'access_token': self._token})
+        resp = httpx.get(f"{self._address}/devices/all", params=self._params)
 
         for dev in resp.json():
             caps = [c for c in dev['capabilities'] if type(c) is str and c in allowed_capabilities]
@@ -110,55 +118,77 @@ class HubitatClient:
             self.devices.append(HubitatDevice(id=dev['id'], label=dev['label'], room=dev['room'], capabilities=caps,
                                               attributes=attributes, commands=commands))
 
-    async def send_command(self, device_id: int, command: str, arguments: Optional[List[Any]] = None):
-        """Sends the provided command with any arguments to the device with the specified device id."""
+    async def send_commands_bulk(self, commands: List[CommandSpec]):
+        """
+        Sends a batch of (device_id, command, arguments) commands over a single connection pool.  Commands for the same
+        device are sent in order, while separate devices are commanded concurrently.
+        """
+        device_commands: Dict[int, List[Tuple[str, Optional[List[Any]]]]] = {}
+        for device_id, command, arguments in commands:
+            device_commands.setdefault(device_id, []).append((command, arguments))
+
+        async with httpx.AsyncClient(limits=_CONNECTION_LIMITS) as client:
+            async def command_device(device_id: int, pending: List[Tuple[str, Optional[List[Any]]]]):
+                for command, arguments in pending:
+                    await self._send_command(client, device_id, command, arguments)
+
+            await aio.gather(*[command_device(device_id, pending) for device_id, pending in device_commands.items()])
+
+    async def _send_command(self, client: httpx.AsyncClient, device_id: int, command: str,
+                            arguments: Optional[List[Any]]):
         url = f"{self._address}/devices/{device_id}/{command}"
         if arguments is not None and len(arguments) > 0:
             url += f"/{','.join([str(a) for a in arguments])}"
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, params={'access_token': self._token})
+        resp = await client.get(url, params=self._params)
         if resp.status_code != 200:
             raise Exception(f"HE Client returned '{resp.status_code}' status: {resp.text}")
 
-    async def get_attribute(self, device_id: int, attribute: str) -> Any:
-        """Gets the current value of the given attribute for the device with the specified device id."""
+    async def get_attributes_bulk(self, queries: List[Tuple[int, str]]) -> List[Any]:
+        """
+        Gets the current values for a batch of (device_id, attribute) queries over a single connection pool.  Each
+        device is only fetched once no matter how many of its attributes are queried.
+        """
+        device_ids = list(dict.fromkeys(device_id for device_id, _ in queries))
+        async with httpx.AsyncClient(limits=_CONNECTION_LIMITS) as client:
+            results = await aio.gather(*[self._get_attributes(client, device_id) for device_id in device_ids])
+
+        device_attributes = dict(zip(device_ids, results))
+        return [device_attributes[device_id].get(attribute) for device_id, attribute in queries]
+
+    async def _get_attributes(self, client: httpx.AsyncClient, device_id: int) -> Dict[str, Any]:
         url = f"{self._address}/devices/{device_id}"
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, params={'access_token': self._token})
+        resp = await client.get(url, params=self._params)
         if resp.status_code != 200:
             raise Exception(f"HE Client returned '{resp.status_code}' status: {resp.text}")
 
         attributes: List[Dict[str, Any]] = resp.json()['attributes']
-        for attr in attributes:
-            if attr['name'] == attribute:
-                return attr['currentValue']
-
-        return None
+        return {attr['name']: attr['currentValue'] for attr in attributes}
 
     async def handle_device_event(self, event: Dict[str, Any]) -> bool:
         """Triggers any callbacks for subscribers registered on this event"""
         device_event = DeviceEvent.model_validate(event)
         print(f'Device Event: {device_event.model_dump_json()}')
 
-        device_id = int(device_event.device_id)
-        if device_id in self._subscriptions:
-            callback = self._subscriptions[device_id]
-            return await callback(device_event)
-        return False
+        callback = self._subscriptions.get((device_event.device_id, device_event.attribute))
+        if callback is None:
+            return False
+        await callback(device_event)
+        return True
 
     def subscribe(self, device_id: int, attributes: List[str], callback: EventCallback):
-        """Registers the provided callback to be invoked for events on the given device attributes"""
-
-        async def subscription(event: DeviceEvent) -> bool:
-            if event.attribute in attributes:
-                await callback(event)
-                return True
-            return False
+        """
+        Registers the provided callback to be invoked for events on the given device attributes, replacing any existing
+        subscription for the device
+        """
+        self.unsubscribe(device_id)
 
-        self._subscriptions[device_id] = subscription
+        for attribute in attributes:
+            self._subscriptions[(device_id, attribute)] = callback
+        self._subscribed_attributes[device_id] = attributes
 
     def unsubscribe(self, device_id: int):
         """Un-registers any callbacks for the given device"""
-        del self._subscriptions[device_id]
+        for attribute in self._subscribed_attributes.pop(device_id, []):
+            self._subscriptions.pop((device_id, attribute), None)
@@ -1,5 +1,5 @@
-import asyncio as aio
-from pydantic import BaseModel, Field
+from pydantic.fields import Field
+from pydantic.main import BaseModel
 from typing import List, Optional
 
 from .client import HubitatClient
@@ -35,9 +35,8 @@ class DeviceCommandFunction(OpenAIFunction[DeviceCommandList]):
         return 'Use this function to control a device in the smart home by issuing it a command'
 
     async def execute(self, commands: DeviceCommandList) -> str:
-        await aio.gather(
-            *[self._he_client.send_command(command.device_id, command.command, arguments=command.arguments) for command
-              in commands.commands])
+        await self._he_client.send_commands_bulk(
+            [(command.device_id, command.command, command.arguments) for command in commands.commands])
 
         # TODO: Partial failures?
         return 'Success'
@@ -1,7 +1,7 @@
-import asyncio as aio
 import json
-from pydantic import BaseModel, Field
-from typing import List
+from pydantic.fields import Field
+from pydantic.main import BaseModel
+from typing import Dict, List
 
 from .client import HubitatClient, HubitatDevice
 from gpt.functions import OpenAIFunction
@@ -35,10 +35,7 @@ class DeviceQueryFunction(OpenAIFunction[DeviceQueryList]):
         return 'Use this function to get the current value of a device attribute'
 
     async def execute(self, queries: DeviceQueryList) -> str:
-        tasks = []
-        for query in queries.queries:
-            tasks.append(aio.create_task(self._he_client.get_attribute(query.device_id, query.attribute)))
-        results = await aio.gather(*tasks)
+        results = await self._he_client.get_attributes_bulk([(q.device_id, q.attribute) for q in queries.queries])
         return json.dumps(dict(zip([f'{q.device_id}_{q.attribute}' for q in queries.queries], results)))
 
 
@@ -50,7 +47,11 @@ class LayoutFunction(OpenAIFunction[LayoutRequest]):
     """GPT function for reporting the layout of the house."""
 
     def __init__(self, devices: List[HubitatDevice]):
-        self._devices = devices
+        room_devices: Dict[str, List[int]] = {}
+        for device in devices:
+            room_devices.setdefault(device.room, []).append(device.id)
+        # Devices don't move between rooms, so each room's ID list only needs to be serialized once
+        self._room_json: Dict[str, str] = {room: json.dumps(ids) for room, ids in room_devices.items()}
 
     def get_name(self) -> str:
         return 'get_devices_for_room'
@@ -59,4 +60,5 @@ class LayoutFunction(OpenAIFunction[LayoutRequest]):
         return 'Use this function to get the list of device IDs for any rooms.'
 
     async def execute(self, request: LayoutRequest) -> str:
-        return json.dumps({room: [dev.id for dev in self._devices if dev.room == room] for room in request.rooms})
+        rooms = dict.fromkeys(request.rooms)
+        return '{' + ', '.join(f'{json.dumps(room)}: {self._room_json.get(room, "[]")}' for room in rooms) + '}'
@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field
+from pydantic.fields import Field
+from pydantic.main import BaseModel
 from typing import List
 
 from .client import HubitatClient
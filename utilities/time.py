@@ -1,17 +1,107 @@
 import asyncio as aio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from pydantic import BaseModel, Field
+import heapq
+from itertools import count
+from pydantic.fields import Field
+from pydantic.main import BaseModel
 import pytz
-from threading import Thread
+from threading import Lock, Thread
 import time
-from typing import Callable, Dict
+from typing import Dict, List, Optional, Set, Tuple
 
 from gpt.client import OpenAISession
 from gpt.functions import OpenAIFunction
+from util import env_var
+
+# Timer names are kept for as long as the timer is pending, so don't let them grow without bound.  The limit is only a
+# hint in the tool schema, it's enforced by TimerScheduler.schedule so that a long name gets a normal failure response.
+MAX_TIMER_NAME_LENGTH = 100
+
+
+class TimerScheduler:
+    """
+    Waits on every timer from one long-lived event loop.  Flask gives each request its own short-lived loop, so timers
+    live on a dedicated loop in a background thread rather than in a sleeping thread of their own.  Pending timers are
+    kept in a single heap and only the earliest deadline has a wakeup scheduled on the loop.
+    """
+
+    def __init__(self, ai_session: OpenAISession):
+        self._ai_session = ai_session
+        self._loop = aio.new_event_loop()
+        # Fired timers hand their blocking OpenAI calls to this loop's default executor, bound how many run at once
+        pool_size = int(env_var('TIMER_POOL_SIZE', allow_null=True) or 8)
+        self._loop.set_default_executor(ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='timer-fire'))
+        self._lock = Lock()
+        # Entries are (deadline, sequence, name) so heap ordering never falls through to comparing names
+        self._heap: List[Tuple[float, int, str]] = []
+        self._timers: Dict[str, int] = {}
+        self._sequence = count()
+        self._wakeup: Optional[aio.TimerHandle] = None
+        self._firing: Set[aio.Task] = set()
+        Thread(target=self._loop.run_forever, name='timer-scheduler', daemon=True).start()
+
+    def schedule(self, name: str, delay: float) -> Optional[str]:
+        """Schedules the named timer to fire after the delay (in seconds), returns why if it couldn't be"""
+        if len(name) > MAX_TIMER_NAME_LENGTH:
+            return f'Failed, timer names must be at most {MAX_TIMER_NAME_LENGTH} characters'
+
+        deadline = time.monotonic() + delay
+        with self._lock:
+            if name in self._timers:
+                return f'Failed, a timer named "{name}" already exists'
+            sequence = next(self._sequence)
+            self._timers[name] = sequence
+            heapq.heappush(self._heap, (deadline, sequence, name))
+            is_earliest = self._heap[0][1] == sequence
+        if is_earliest:
+            self._loop.call_soon_threadsafe(self._rearm)
+        return None
+
+    def cancel(self, name: str) -> bool:
+        """Cancels the named timer, returns False if no such timer is pending"""
+        with self._lock:
+            if self._timers.pop(name, None) is None:
+                return False
+            # The heap entry is left in place and skipped when its deadline comes up, unless cancelled entries have
+            # come to outnumber the live ones - then it's worth compacting the heap (amortized O(1) per cancel)
+            if len(self._heap) > 2 * len(self._timers):
+                self._heap = [entry for entry in self._heap if self._timers.get(entry[2]) == entry[1]]
+                heapq.heapify(self._heap)
+            return True
+
+    def _rearm(self):
+        """Points the single pending wakeup at the earliest deadline, must be called on the scheduler loop"""
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        with self._lock:
+            if len(self._heap) == 0:
+                return
+            delay = self._heap[0][0] - time.monotonic()
+        self._wakeup = self._loop.call_later(max(delay, 0), self._fire_expired)
+
+    def _fire_expired(self):
+        self._wakeup = None
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            while len(self._heap) > 0 and self._heap[0][0] <= now:
+                _, sequence, name = heapq.heappop(self._heap)
+                if self._timers.get(name) == sequence:
+                    del self._timers[name]
+                    expired.append(name)
+
+        for name in expired:
+            task = self._loop.create_task(self._ai_session.handle_timer_event(name))
+            self._firing.add(task)
+            task.add_done_callback(self._firing.discard)
+        self._rearm()
 
 
 class TimerRequest(BaseModel):
-    name: str = Field(description='The name of the timer, this must be unique among all running timers.')
+    name: str = Field(description='The name of the timer, this must be unique among all running timers.',
+                      json_schema_extra={'maxLength': MAX_TIMER_NAME_LENGTH})
     weeks: int = Field(description='The number of weeks on the timer', ge=0, default=0)
     days: int = Field(description='The number of days on the timer', ge=0, default=0)
     hours: int = Field(description='The number of hours on the timer', ge=0, default=0)
@@ -19,18 +109,11 @@ class TimerRequest(BaseModel):
     seconds: int = Field(description='The number of seconds on the timer', ge=0, default=0)
 
 
-def fire_timer_with_delay(name: str, session: OpenAISession, seconds: int, callback: Callable[[], None]):
-    time.sleep(seconds)
-    aio.run(session.handle_timer_event(name))
-    callback()
-
-
 class TimerFunction(OpenAIFunction[TimerRequest]):
     """GPT Function for executing a timer."""
 
-    def __init__(self, ai_session: OpenAISession):
-        self._ai_session = ai_session
-        self._timers: Dict[str, Thread] = {}
+    def __init__(self, scheduler: TimerScheduler):
+        self._scheduler = scheduler
 
     def get_name(self) -> str:
         return 'set_timer'
@@ -41,30 +124,27 @@ class TimerFunction(OpenAIFunction[TimerRequest]):
     async def execute(self, request: TimerRequest) -> str:
         diff_data = request.model_dump()
         name = diff_data.pop('name')
-        if name in self._timers:
-            return f'Failed, a timer named "{name}" already exists'
-
-        def callback():
-            del self._timers[name]
-
         diff = timedelta(**diff_data)
-        self._timers[name] = Thread(target=fire_timer_with_delay,
-                                    args=(name, self._ai_session, diff.total_seconds(), callback))
-        self._timers[name].start()
-        return 'Success'
+        failure = self._scheduler.schedule(name, diff.total_seconds())
+        if failure is not None:
+            return failure
+
+        # Saves a follow-up call to get_current_time when the user asks when the timer will go off
+        fire_at = (datetime.now().astimezone() + diff).isoformat(timespec='seconds')
+        return f'Success, the timer will fire at {fire_at}'
 
 
 class ScheduleRequest(BaseModel):
-    name: str = Field(description='A name for the request, must be unique')
+    name: str = Field(description='A name for the request, must be unique',
+                      json_schema_extra={'maxLength': MAX_TIMER_NAME_LENGTH})
     time: datetime = Field(description='The time at which to trigger the future action')
 
 
 class ScheduledTimerFunction(OpenAIFunction[ScheduleRequest]):
     """GPT Function for executing a scheduled timer"""
 
-    def __init__(self, ai_session: OpenAISession):
-        self._ai_session = ai_session
-        self._timers: Dict[str, Thread] = {}
+    def __init__(self, scheduler: TimerScheduler):
+        self._scheduler = scheduler
 
     def get_name(self) -> str:
         return 'schedule_future_action'
@@ -73,18 +153,35 @@ class ScheduledTimerFunction(OpenAIFunction[ScheduleRequest]):
         return 'Use this function to schedule an action which will trigger at a specific time'
 
     async def execute(self, request: ScheduleRequest) -> str:
-        if request.name in self._timers:
-            return f'Failed, a timer named "{request.name}" already exists'
-        if request.time < datetime.now(request.time.tzinfo):
+        now = datetime.now(request.time.tzinfo)
+        if request.time < now:
             return f'Failed, timers must occur in the future'
+        failure = self._scheduler.schedule(request.name, (request.time - now).total_seconds())
+        if failure is not None:
+            return failure
+        return 'Success'
+
+
+class CancelTimerRequest(BaseModel):
+    name: str = Field(description='The name of the timer or scheduled action to cancel',
+                      json_schema_extra={'maxLength': MAX_TIMER_NAME_LENGTH})
 
-        def callback():
-            del self._timers[request.name]
 
-        diff = request.time - datetime.now(request.time.tzinfo)
-        self._timers[request.name] = Thread(target=fire_timer_with_delay,
-                                            args=(request.name, self._ai_session, diff.total_seconds(), callback()))
-        self._timers[request.name].start()
+class CancelTimerFunction(OpenAIFunction[CancelTimerRequest]):
+    """GPT Function for cancelling a pending timer"""
+
+    def __init__(self, scheduler: TimerScheduler):
+        self._scheduler = scheduler
+
+    def get_name(self) -> str:
+        return 'cancel_timer'
+
+    def get_description(self) -> str:
+        return 'Use this function to cancel a timer or scheduled action before it triggers'
+
+    async def execute(self, request: CancelTimerRequest) -> str:
+        if not self._scheduler.cancel(request.name):
+            return f'Failed, there is no pending timer named "{request.name}"'
         return 'Success'
 
 